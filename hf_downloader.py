@@ -7,16 +7,466 @@ HuggingFace 下载工具
 
 import os
 import sys
+import math
+import asyncio
+import ctypes
+import shutil
+import queue
 import requests
 import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_EXCEPTION
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from urllib.parse import urlparse, unquote, urljoin
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import re
 import json
-from bs4 import BeautifulSoup
+import multiprocessing
+
+try:
+    import aiohttp
+except ImportError:  # 未安装 aiohttp 时批量下载退回线程池
+    aiohttp = None
+
+try:
+    import httpx
+except ImportError:  # 未安装 httpx 时 API 请求使用 requests
+    httpx = None
+
+try:
+    import pycurl
+except ImportError:  # 未安装 pycurl 时不能使用 libcurl 后端
+    pycurl = None
+
+liburing = None
+if sys.platform.startswith('linux'):
+    try:
+        import liburing
+    except ImportError:  # 未安装 liburing 时使用普通文件写入
+        pass
+
+
+# HuggingFace URL 格式（模块加载时编译一次）
+# https://hf-mirror.com/username/model/tree/main/subfolder
+_TREE_RE = re.compile(r'(?:hf-mirror\.com|huggingface\.co)/([^/]+)/([^/]+)/tree/([^/]+)(?:/(.*))?')
+# https://hf-mirror.com/username/model/resolve/main/file.bin
+# https://huggingface.co/username/model/blob/main/file.bin
+_FILE_RE = re.compile(r'(?:hf-mirror\.com|huggingface\.co)/([^/]+)/([^/]+)/(?:resolve|blob)/([^/]+)/(.+)')
+
+# 分段并行下载参数
+DEFAULT_CONNECTIONS = 8  # 默认并发连接数
+PART_SIZE_MAX = 64 * 1024 * 1024  # 单个分段最大 64MB，便于断点续传
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024  # 小于 8MB 的文件不分段
+
+# 批量下载参数
+POOL_SIZE = 32  # 连接池大小
+BATCH_WORKERS = 8  # 同时下载的小文件数
+
+# aiohttp 连接参数
+AIO_LIMIT = 64
+AIO_LIMIT_PER_HOST = 16
+AIO_KEEPALIVE = 60
+AIO_CHUNK_SIZE = 1 << 20  # 1MB
+
+# 文件大小单位
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+
+# 界面刷新间隔（毫秒）
+UI_REFRESH_INTERVAL = 100
+
+# 文件内容请求不要压缩（模型文件本身已是二进制，压缩只会增加解压开销，还会让 Content-Length 和 Range 失去意义）
+IDENTITY_ENCODING = {'Accept-Encoding': 'identity'}
+
+# 下载后端：设置 HF_DOWNLOADER_BACKEND=pycurl 时并发传输由 libcurl 的 CurlMulti 驱动
+BACKEND = os.environ.get('HF_DOWNLOADER_BACKEND', '').lower()
+USE_PYCURL = BACKEND == 'pycurl' and pycurl is not None
+if BACKEND == 'pycurl' and pycurl is None:
+    print("未安装 pycurl，使用默认下载后端")
+
+# 元数据缓存（ETag / Last-Modified）
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hf_downloader')
+META_CACHE_PATH = os.path.join(CACHE_DIR, 'meta.json')
+LOCAL_INDEX_PATH = os.path.join(CACHE_DIR, 'index.json')  # ETag -> 已下载的本地文件
+
+# 单文件下载写入参数
+CHUNK_SIZE = 1 << 20  # 每次读取 1MB
+WRITEV_BATCH = 4  # 攒够 4 个块后一次 writev
+
+# 预分配磁盘空间
+FALLOC_FL_KEEP_SIZE = 0x01  # Linux：只分配空间，不改变文件大小
+FILE_ALLOCATION_INFO = 5  # Windows：FILE_INFO_BY_HANDLE_CLASS.FileAllocationInfo
+
+# io_uring 写入参数
+URING_DEPTH = 32  # 队列深度，也是最多同时在途的写请求数
+
+_pwrite_lock = threading.Lock()
+# 下载进程（DownloaderProcess）中共享进度槽的数量，也是同时进行的任务数上限
+ENGINE_SLOTS = 8
+
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='hf-batch')
+
+
+def _pwrite(fd, data, offset):
+    """在指定偏移写入数据（Windows 上没有 os.pwrite，退化为加锁的 lseek+write）"""
+    if hasattr(os, 'pwrite'):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+        return
+    with _pwrite_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+
+
+class _UringWriter:
+    """
+    基于 io_uring 的文件写入器（仅 Linux，需安装 liburing）
+    写请求提交后立即返回，队列满时再统一收割，让网络接收和磁盘写入重叠
+    """
+
+    def __init__(self, save_path, offset, depth=URING_DEPTH):
+        flags = os.O_WRONLY | os.O_CREAT | (0 if offset else os.O_TRUNC)
+        # 不用 O_APPEND：写请求可能乱序完成，必须显式指定偏移
+        self.fd = os.open(save_path, flags, 0o644)
+        self.offset = offset
+        self.depth = depth
+        self.ring = liburing.io_uring()
+        self.cqe = liburing.io_uring_cqe()
+        self.inflight = {}  # user_data -> (iovec, data, offset)，收割前必须保持数据存活
+        self.next_id = 0
+        try:
+            liburing.io_uring_queue_init(depth, self.ring, 0)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def write(self, data):
+        if len(self.inflight) >= self.depth:
+            self._reap()
+        iov = liburing.iovec(data)
+        sqe = liburing.io_uring_get_sqe(self.ring)
+        liburing.io_uring_prep_write(sqe, self.fd, iov.iov_base, iov.iov_len, self.offset)
+        liburing.io_uring_sqe_set_data64(sqe, self.next_id)
+        self.inflight[self.next_id] = (iov, data, self.offset)
+        self.next_id += 1
+        self.offset += len(data)
+        liburing.io_uring_submit(self.ring)
+
+    def fileno(self):
+        return self.fd
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        """等待所有在途写请求完成"""
+        self._reap()
+
+    def _reap(self):
+        """等待所有在途写请求完成；写入出错（ENOSPC、EIO 等）时先收割完全部请求再抛出"""
+        error = None
+        while self.inflight:
+            liburing.io_uring_wait_cqe(self.ring, self.cqe)
+            res, user_data = self.cqe.res, self.cqe.user_data
+            liburing.io_uring_cqe_seen(self.ring, self.cqe)
+            _, data, offset = self.inflight.pop(user_data)
+            try:
+                written = liburing.trap_error(res)
+                if written < len(data):
+                    # 普通文件极少出现短写，剩余部分同步补写
+                    _pwrite(self.fd, data[written:], offset + written)
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+
+    def close(self):
+        if self.fd is None:
+            return
+        try:
+            self._reap()
+        finally:
+            liburing.io_uring_queue_exit(self.ring)
+            os.close(self.fd)
+            self.fd = None
+
+
+def _preallocate(fd, offset, length):
+    """
+    为文件预留 [offset, offset+length) 的磁盘空间，减少下载过程中的扩展和碎片
+    不改变文件大小，断点续传仍以实际大小为准；仅作优化，失败时忽略
+    """
+    if length <= 0:
+        return
+    try:
+        if sys.platform.startswith('linux'):
+            libc = ctypes.CDLL(None, use_errno=True)
+            libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+            if libc.fallocate(fd, FALLOC_FL_KEEP_SIZE, offset, length) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+        elif sys.platform == 'win32':
+            import msvcrt
+            allocation_size = ctypes.c_longlong(offset + length)
+            if not ctypes.windll.kernel32.SetFileInformationByHandle(
+                    msvcrt.get_osfhandle(fd), FILE_ALLOCATION_INFO,
+                    ctypes.byref(allocation_size), ctypes.sizeof(allocation_size)):
+                raise ctypes.WinError()
+    except Exception as e:
+        print(f"预分配磁盘空间失败: {e}")
+
+
+def _copy_local(src, dst, size):
+    """
+    在本地复制文件，不经过网络
+    Linux 用 os.sendfile 在内核中完成拷贝，Windows 用 CopyFileExW，其他平台用 shutil.copyfile
+    先复制到临时文件再替换 dst，中途失败时 dst 保持原样（已下载的部分仍可续传）
+    """
+    tmp_path = dst + '.copy.tmp'
+    try:
+        if sys.platform.startswith('linux'):
+            with open(src, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+                    if sent == 0:
+                        raise IOError(f"复制不完整: {offset}/{size}")
+                    offset += sent
+        elif sys.platform == 'win32':
+            if not ctypes.windll.kernel32.CopyFileExW(src, tmp_path, None, None, None, 0):
+                raise ctypes.WinError()
+        else:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _parse_total_size(headers, status_code):
+    """
+    从响应头解析文件总大小
+    206/416 使用 Content-Range（bytes a-b/TOTAL 或 bytes */TOTAL），200 使用 Content-Length
+    """
+    if status_code in (206, 416):
+        total = headers.get('Content-Range', '').rsplit('/', 1)[-1]
+        return int(total) if total.isdigit() else 0
+    length = headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else 0
+
+
+class _CurlTransfer:
+    """
+    CurlMulti 中的一个传输：把 [start, end] 写入 fd 的对应偏移（end 为 None 表示到文件末尾）
+    resume 为 True 时从 path 的已有大小处续传（开始传输时才打开文件），服务器返回 200 时从头写入
+    """
+
+    def __init__(self, url, fd=None, start=0, end=None, key=None, resume=False, path=None):
+        self.url = url
+        self.fd = fd
+        self.path = path
+        self.start = start
+        self.end = end
+        self.key = key
+        self.resume = resume
+        self.offset = start  # 下一块数据写入的位置
+        self.total = 0  # 文件总大小（收到响应头后才知道）
+        self.status = None
+        self.started = False  # 是否已收到响应体
+        self.content_range = ''
+        self.error = None
+        self.already_complete = False
+        self.handle = None
+        self.downloader = None
+        self.progress_callback = None
+        self.status_callback = None
+
+    def create_handle(self, downloader):
+        """创建对应的 pycurl.Curl 句柄"""
+        self.downloader = downloader
+        if self.fd is None:
+            self.start = self.offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        handle = pycurl.Curl()
+        handle.setopt(pycurl.URL, self.url)
+        handle.setopt(pycurl.USERAGENT, downloader.session.headers['User-Agent'])
+        handle.setopt(pycurl.FOLLOWLOCATION, 1)
+        handle.setopt(pycurl.NOSIGNAL, 1)
+        handle.setopt(pycurl.CONNECTTIMEOUT, 30)
+        # 30 秒内没有数据视为超时
+        handle.setopt(pycurl.LOW_SPEED_LIMIT, 1)
+        handle.setopt(pycurl.LOW_SPEED_TIME, 30)
+        handle.setopt(pycurl.TCP_KEEPALIVE, 1)
+        handle.setopt(pycurl.HTTP_VERSION, pycurl.CURL_HTTP_VERSION_2TLS)
+        # 等待可复用的 HTTP/2 连接，而不是另开新连接
+        handle.setopt(pycurl.PIPEWAIT, 1)
+        if self.end is not None:
+            handle.setopt(pycurl.RANGE, f'{self.start}-{self.end}')
+        elif self.start > 0:
+            handle.setopt(pycurl.RANGE, f'{self.start}-')
+        handle.setopt(pycurl.WRITEFUNCTION, self._write)
+        handle.setopt(pycurl.HEADERFUNCTION, self._header)
+        handle.setopt(pycurl.NOPROGRESS, 0)
+        handle.setopt(pycurl.XFERINFOFUNCTION, self._xferinfo)
+        self.handle = handle
+        return handle
+
+    def _header(self, line):
+        # 回调中不能调用 getinfo，状态码从状态行解析（重定向时以最后一个响应为准）
+        if line.startswith(b'HTTP/'):
+            parts = line.split()
+            self.status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+            self.content_range = ''
+        elif line.lower().startswith(b'content-range:'):
+            self.content_range = line.split(b':', 1)[1].strip().decode('latin-1')
+
+    def _write(self, data):
+        if not self.started:
+            self.started = True
+            if self.status == 200 and self.start > 0:
+                if not self.resume:
+                    self.error = "分段请求失败: HTTP 200"
+                    return 0
+                # 服务器不支持断点续传，从头开始写
+                self.offset = self.start = 0
+                os.ftruncate(self.fd, 0)
+            elif self.status not in (200, 206):
+                self.error = f"HTTP {self.status}"
+                return 0  # 中止传输
+        _pwrite(self.fd, data, self.offset)
+        self.offset += len(data)
+
+    def _xferinfo(self, dltotal, dlnow, ultotal, ulnow):
+        if dltotal:
+            self.total = self.start + dltotal
+        # 返回非 0 值中止传输
+        return 1 if self.downloader.cancel_flag else 0
+
+    def succeeded(self):
+        """传输是否成功（续传时 416 且总大小一致视为已完整）"""
+        if self.resume and self.status == 416:
+            total = self.content_range.rsplit('/', 1)[-1]
+            self.already_complete = total.isdigit() and int(total) == self.start
+            return self.already_complete
+        return self.error is None and self.status in (200, 206)
+
+    def needs_restart(self):
+        """续传时 416 且总大小不一致，说明本地文件与远程文件不一致"""
+        return self.resume and self.status == 416 and self.start > 0 and not self.already_complete
+
+    def restart(self):
+        """清空本地文件，重置状态以便从头重新传输"""
+        if self.status_callback:
+            self.status_callback("本地文件与远程文件不一致，从头开始下载...")
+        os.ftruncate(self.fd, 0)
+        self.start = self.offset = self.total = 0
+        self.status = self.error = None
+        self.started = False
+        self.content_range = ''
+
+
+class _PausableReader:
+    """
+    包装 response.raw 供 shutil.copyfileobj 读取
+    暂停时阻塞在 read 中（连接保持），取消时返回 b'' 结束复制
+    """
+
+    def __init__(self, raw, downloader, on_pause=None):
+        self.raw = raw
+        self.downloader = downloader
+        self.on_pause = on_pause
+
+    def read(self, size):
+        if self.downloader.pause_flag and self.on_pause:
+            self.on_pause()
+        while self.downloader.pause_flag and not self.downloader.cancel_flag:
+            time.sleep(0.1)
+        if self.downloader.cancel_flag:
+            return b''
+        return self.raw.read(size)
+
+
+class _VectorWriter:
+    """
+    普通文件写入器
+    攒够 WRITEV_BATCH 个块后用一次 os.writev 写入，减少系统调用次数
+    """
+
+    def __init__(self, save_path, offset, batch=WRITEV_BATCH):
+        # 不使用 Python 层缓冲，避免数据被拷贝两次
+        self.file = open(save_path, 'ab' if offset else 'wb', buffering=0)
+        self.batch = batch
+        self.buffers = []
+        self.position = offset  # 已接收数据的末尾位置（含尚未写入的缓存）
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffers.append(data)
+        self.position += len(data)
+        if len(self.buffers) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        """把缓存的块写入磁盘"""
+        if not self.buffers:
+            return
+        if hasattr(os, 'writev'):
+            data = b''
+            written = os.writev(self.file.fileno(), self.buffers)
+            if written < sum(len(b) for b in self.buffers):
+                # 部分写入，剩余部分逐段补写
+                data = b''.join(self.buffers)[written:]
+        else:
+            data = b''.join(self.buffers)
+        self.buffers = []
+        while data:
+            data = data[self.file.write(data):]
+
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.file.close()
+
+
+def _open_writer(save_path, offset):
+    """打开下载文件，Linux 上优先使用 io_uring，否则使用 writev 批量写入（追加或新建）"""
+    if liburing is not None:
+        try:
+            return _UringWriter(save_path, offset)
+        except Exception as e:
+            print(f"io_uring 不可用，使用普通写入: {e}")
+    return _VectorWriter(save_path, offset)
 
 
 class HFDownloader:
@@ -27,8 +477,19 @@ class HFDownloader:
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        # 分段下载和批量下载共用连接池，复用 keep-alive 连接
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE,
+                              max_retries=Retry(total=5, backoff_factor=0.3))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.api_client = self._create_api_client()
         self.cancel_flag = False
         self.pause_flag = False
+        self._loop = None  # aiohttp 使用的事件循环（后台线程）
+        self._loop_lock = threading.Lock()
+        self._meta_lock = threading.Lock()
+        self._meta_cache = self._load_meta_cache()
+        self._local_index = self._load_local_index()
         
     def parse_hf_url(self, url):
         """
@@ -40,44 +501,25 @@ class HFDownloader:
         url = url.split('?')[0]
         
         # 检查是否是目录URL (tree格式)
-        tree_patterns = [
-            r'hf-mirror\.com/([^/]+)/([^/]+)/tree/([^/]+)(?:/(.*))?',
-            r'huggingface\.co/([^/]+)/([^/]+)/tree/([^/]+)(?:/(.*))?',
-        ]
-        
-        for pattern in tree_patterns:
-            match = re.search(pattern, url)
-            if match:
-                username, model, branch = match.groups()[:3]
-                subpath = match.groups()[3] if len(match.groups()) > 3 else ''
-                repo_info = {
-                    'username': username,
-                    'model': model,
-                    'branch': branch,
-                    'subpath': subpath or ''
-                }
-                return None, None, True, repo_info
+        match = _TREE_RE.search(url)
+        if match:
+            username, model, branch, subpath = match.groups()
+            repo_info = {
+                'username': username,
+                'model': model,
+                'branch': branch,
+                'subpath': subpath or ''
+            }
+            return None, None, True, repo_info
         
         # 检查单文件URL
-        file_patterns = [
-            # https://hf-mirror.com/username/model/resolve/main/file.bin
-            r'hf-mirror\.com/([^/]+)/([^/]+)/resolve/([^/]+)/(.+)',
-            # https://hf-mirror.com/username/model/blob/main/file.bin
-            r'hf-mirror\.com/([^/]+)/([^/]+)/blob/([^/]+)/(.+)',
-            # https://huggingface.co/username/model/resolve/main/file.bin
-            r'huggingface\.co/([^/]+)/([^/]+)/resolve/([^/]+)/(.+)',
-            # https://huggingface.co/username/model/blob/main/file.bin
-            r'huggingface\.co/([^/]+)/([^/]+)/blob/([^/]+)/(.+)',
-        ]
-        
-        for pattern in file_patterns:
-            match = re.search(pattern, url)
-            if match:
-                username, model, branch, filepath = match.groups()
-                # 将 blob 转换为 resolve 用于下载
-                download_url = f"https://hf-mirror.com/{username}/{model}/resolve/{branch}/{filepath}"
-                filename = os.path.basename(unquote(filepath))
-                return download_url, filename, False, None
+        match = _FILE_RE.search(url)
+        if match:
+            username, model, branch, filepath = match.groups()
+            # 将 blob 转换为 resolve 用于下载
+            download_url = f"https://hf-mirror.com/{username}/{model}/resolve/{branch}/{filepath}"
+            filename = os.path.basename(unquote(filepath))
+            return download_url, filename, False, None
         
         # 如果是直接的文件URL
         if url.startswith('http'):
@@ -88,29 +530,155 @@ class HFDownloader:
             
         return None, None, False, None
     
+    def _create_api_client(self):
+        """
+        创建 API 请求客户端（HTTP/2 + 压缩），用于获取 JSON 文件列表
+        httpx 默认的 Accept-Encoding 只包含已安装解码器的编码（gzip，以及 br/zstd）
+        """
+        if httpx is None:
+            return None
+        headers = {'User-Agent': self.session.headers['User-Agent']}
+        try:
+            return httpx.Client(http2=True, timeout=30, headers=headers, follow_redirects=True)
+        except ImportError:  # 未安装 h2
+            return httpx.Client(timeout=30, headers=headers, follow_redirects=True)
+
+    def _load_meta_cache(self):
+        """读取本地元数据缓存 {'size': {url: {...}}, 'tree': {api_url: {...}}}"""
+        try:
+            with open(META_CACHE_PATH, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        cache.setdefault('size', {})
+        cache.setdefault('tree', {})
+        return cache
+
+    def _save_meta_cache(self):
+        """保存本地元数据缓存（调用方需持有 _meta_lock）"""
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_path = META_CACHE_PATH + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._meta_cache, f)
+            os.replace(tmp_path, META_CACHE_PATH)
+        except OSError as e:
+            print(f"保存缓存失败: {e}")
+
+    def _load_local_index(self):
+        """读取本地文件索引 {etag: {'path': ..., 'size': ...}}"""
+        try:
+            with open(LOCAL_INDEX_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _remember_local(self, etag, save_path, size):
+        """下载完成后记录 ETag 对应的本地文件"""
+        if not etag or size <= 0:
+            return
+        with self._meta_lock:
+            # 界面进程与下载进程都会写索引：写入前重新读取并合并，临时文件按进程区分
+            self._local_index.update(self._load_local_index())
+            self._local_index[etag] = {'path': os.path.abspath(save_path), 'size': size}
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                tmp_path = f"{LOCAL_INDEX_PATH}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._local_index, f)
+                os.replace(tmp_path, LOCAL_INDEX_PATH)
+            except OSError as e:
+                print(f"保存本地索引失败: {e}")
+
+    def _clone_from_index(self, etag, size, save_path, status_callback=None):
+        """
+        本地已有 ETag 相同且大小一致的文件（如更换了保存目录），直接复制到 save_path
+        返回是否已复制
+        """
+        if not etag or size <= 0:
+            return False
+        with self._meta_lock:
+            entry = self._local_index.get(etag)
+            if entry is None:
+                # 可能由另一个进程刚写入
+                self._local_index.update(self._load_local_index())
+                entry = self._local_index.get(etag)
+        if not entry or entry.get('size') != size:
+            return False
+        src = entry['path']
+        try:
+            if not os.path.isfile(src) or os.path.getsize(src) != size:
+                return False
+            if os.path.exists(save_path) and os.path.samefile(src, save_path):
+                return False
+            if status_callback:
+                status_callback(f"本地已有相同文件，直接复制: {src}")
+            _copy_local(src, save_path, size)
+            return True
+        except OSError as e:
+            print(f"本地复制失败: {e}")
+            return False
+
+    def _conditional_headers(self, entry):
+        """根据缓存条目生成条件请求头"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _update_meta_cache(self, kind, key, response, **values):
+        """记录响应的 ETag / Last-Modified 及对应数据"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        with self._meta_lock:
+            self._meta_cache[kind][key] = dict(etag=etag, last_modified=last_modified, **values)
+            self._save_meta_cache()
+
     def get_file_size(self, url):
-        """获取远程文件大小"""
+        """获取远程文件大小（仅查询，不下载），文件未变化时（304）使用缓存"""
+        with self._meta_lock:
+            cached = self._meta_cache['size'].get(url)
         try:
-            response = self.session.head(url, allow_redirects=True, timeout=10)
+            headers = dict(self._conditional_headers(cached), **IDENTITY_ENCODING)
+            response = self.session.head(url, headers=headers,
+                                         allow_redirects=True, timeout=10)
+            if response.status_code == 304 and cached:
+                return cached['size']
             if response.status_code == 200:
-                return int(response.headers.get('Content-Length', 0))
+                size = int(response.headers.get('Content-Length', 0))
+                self._update_meta_cache('size', url, response, size=size)
+                return size
         except Exception as e:
             print(f"获取文件大小失败: {e}")
         return 0
     
+    def _resume_request(self, url, offset, probe=False):
+        """
+        从 offset 处发起续传 GET（流式），文件总大小从响应头获取，不再单独发 HEAD
+        probe 为 True 时 offset 为 0 也带上 Range，由 206 判断服务器是否支持分段
+        """
+        headers = dict(IDENTITY_ENCODING)
+        if offset > 0 or probe:
+            headers['Range'] = f'bytes={offset}-'
+        return self.session.get(url, headers=headers, stream=True, timeout=30)
+    
     def format_size(self, size):
-        """格式化文件大小"""
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if size < 1024.0:
-                return f"{size:.2f} {unit}"
-            size /= 1024.0
-        return f"{size:.2f} PB"
+        """格式化文件大小（按二进制位数直接确定单位）"""
+        if size < 1024:
+            return f"{size:.2f} B"
+        i = min((int(size).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+        return f"{size / (1 << (10 * i)):.2f} {_SIZE_UNITS[i]}"
     
     def format_speed(self, speed):
         """格式化下载速度"""
         return f"{self.format_size(speed)}/s"
     
-    def download_file(self, url, save_path, progress_callback=None, status_callback=None):
+    def download_file(self, url, save_path, progress_callback=None, status_callback=None, response=None):
         """
         下载文件，支持断点续传
         
@@ -119,10 +687,8 @@ class HFDownloader:
             save_path: 保存路径
             progress_callback: 进度回调函数 (downloaded, total, speed, percentage)
             status_callback: 状态回调函数 (message)
+            response: 已发出的续传请求的响应（download_file_parallel 探测时传入，避免重复请求）
         """
-        self.cancel_flag = False
-        self.pause_flag = False
-        
         # 确保目录存在
         os.makedirs(os.path.dirname(save_path) if os.path.dirname(save_path) else '.', exist_ok=True)
         
@@ -131,95 +697,617 @@ class HFDownloader:
         if os.path.exists(save_path):
             downloaded_size = os.path.getsize(save_path)
         
-        # 获取文件总大小
-        total_size = self.get_file_size(url)
-        
-        if total_size == 0:
-            if status_callback:
-                status_callback("无法获取文件大小，尝试直接下载...")
-        
-        # 如果文件已完整下载
-        if downloaded_size > 0 and downloaded_size == total_size:
-            if status_callback:
-                status_callback("文件已存在且完整，无需重新下载")
-            if progress_callback:
-                progress_callback(total_size, total_size, 0, 100.0)
-            return True
-        
-        # 设置断点续传的请求头
-        headers = self.session.headers.copy()
-        if downloaded_size > 0:
-            headers['Range'] = f'bytes={downloaded_size}-'
-            if status_callback:
-                status_callback(f"从 {self.format_size(downloaded_size)} 处继续下载...")
+        if downloaded_size > 0 and status_callback:
+            status_callback(f"从 {self.format_size(downloaded_size)} 处继续下载...")
         
         try:
-            response = self.session.get(url, headers=headers, stream=True, timeout=30)
+            if response is None:
+                response = self._resume_request(url, downloaded_size)
+            
+            # 请求范围超出文件末尾，说明文件已完整下载
+            if response.status_code == 416:
+                total_size = _parse_total_size(response.headers, response.status_code)
+                response.close()
+                if total_size == downloaded_size:
+                    if status_callback:
+                        status_callback("文件已存在且完整，无需重新下载")
+                    if progress_callback:
+                        progress_callback(total_size, total_size, 0, 100.0)
+                    return True
+                if status_callback:
+                    status_callback("本地文件与远程文件不一致，从头开始下载...")
+                downloaded_size = 0
+                response = self.session.get(url, headers=IDENTITY_ENCODING, stream=True, timeout=30)
             
-            # 检查是否支持断点续传
-            if downloaded_size > 0 and response.status_code != 206:
+            # 检查是否支持断点续传（返回 200 时响应即为完整文件，直接使用）
+            elif downloaded_size > 0 and response.status_code == 200:
                 if status_callback:
                     status_callback("服务器不支持断点续传，从头开始下载...")
                 downloaded_size = 0
-                response = self.session.get(url, stream=True, timeout=30)
             
             if response.status_code not in [200, 206]:
                 if status_callback:
                     status_callback(f"下载失败: HTTP {response.status_code}")
                 return False
             
-            # 打开文件（追加或新建）
-            mode = 'ab' if downloaded_size > 0 else 'wb'
+            total_size = _parse_total_size(response.headers, response.status_code)
+            if total_size == 0:
+                if status_callback:
+                    status_callback("无法获取文件大小，尝试直接下载...")
+            
+            # 本地其他位置已有相同文件时直接复制，丢弃响应体
+            etag = response.headers.get('ETag')
+            if self._clone_from_index(etag, total_size, save_path, status_callback):
+                response.close()
+                if progress_callback:
+                    progress_callback(total_size, total_size, 0, 100.0)
+                if status_callback:
+                    status_callback("下载完成！")
+                return True
             
             # 下载参数
-            chunk_size = 8192  # 8KB
-            start_time = time.time()
-            last_update_time = start_time
+            last_update_time = time.time()
             last_downloaded = downloaded_size
             
-            with open(save_path, mode) as f:
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    # 检查暂停标志
-                    while self.pause_flag and not self.cancel_flag:
-                        time.sleep(0.1)
+            # 直接从 raw 读取，省去 iter_content 的生成器开销
+            # 已请求 identity 编码，只有服务器仍返回压缩内容时才解压
+            response.raw.decode_content = response.headers.get('Content-Encoding', 'identity') != 'identity'
+            errors = []
+            
+            with _open_writer(save_path, downloaded_size) as f:
+                _preallocate(f.fileno(), downloaded_size, total_size - downloaded_size)
+                source = _PausableReader(response.raw, self, on_pause=f.flush)
+                
+                def copy():
+                    try:
+                        shutil.copyfileobj(source, f, CHUNK_SIZE)
+                    except Exception as e:
+                        errors.append(e)
+                
+                # 复制在单独线程中进行，本线程每0.5秒采样一次进度
+                copier = threading.Thread(target=copy, daemon=True)
+                copier.start()
+                while copier.is_alive():
+                    copier.join(0.5)
                     
-                    # 检查取消标志
                     if self.cancel_flag:
-                        if status_callback:
-                            status_callback("下载已取消")
-                        return False
+                        # 关闭连接，让阻塞在 recv 上的复制线程立即退出
+                        response.close()
+                        copier.join()
+                        break
                     
+                    downloaded_size = f.tell()
+                    current_time = time.time()
+                    elapsed = current_time - last_update_time
+                    if progress_callback and copier.is_alive() and elapsed > 0:
+                        speed = (downloaded_size - last_downloaded) / elapsed
+                        percentage = (downloaded_size / total_size * 100) if total_size > 0 else 0
+                        progress_callback(downloaded_size, total_size, speed, percentage)
+                    last_update_time = current_time
+                    last_downloaded = downloaded_size
+                
+                downloaded_size = f.tell()
+            
+            # 检查取消标志
+            if self.cancel_flag:
+                if status_callback:
+                    status_callback("下载已取消")
+                return False
+            
+            if errors:
+                raise errors[0]
+            
+            if downloaded_size == total_size:
+                self._remember_local(etag, save_path, total_size)
+            
+            # 最终更新进度
+            if progress_callback:
+                progress_callback(downloaded_size, total_size, 0, 100.0)
+            
+            if status_callback:
+                status_callback("下载完成！")
+            
+            return True
+            
+        except Exception as e:
+            if status_callback:
+                status_callback(f"下载出错: {str(e)}")
+            return False
+
+    def download_file_parallel(self, url, save_path, num_conns=DEFAULT_CONNECTIONS,
+                               progress_callback=None, status_callback=None):
+        """
+        多连接分段下载，支持断点续传
+        服务器不支持 Range 或文件较小时退回 download_file
+
+        Args:
+            url: 下载链接
+            save_path: 保存路径
+            num_conns: 并发连接数
+            progress_callback: 进度回调函数 (downloaded, total, speed, percentage)
+            status_callback: 状态回调函数 (message)
+        """
+        state_path = save_path + '.part.json'
+
+        # 用 download_file 相同的续传 GET 探测文件信息，小文件直接接着读响应体，只需一次往返
+        existing = os.path.getsize(save_path) if os.path.exists(save_path) else 0
+        try:
+            response = self._resume_request(url, existing, probe=True)
+        except Exception as e:
+            print(f"获取文件信息失败: {e}")
+            return self.download_file(url, save_path, progress_callback, status_callback)
+        total_size = _parse_total_size(response.headers, response.status_code)
+        accept_ranges = (response.status_code in (206, 416)
+                         or response.headers.get('Accept-Ranges', '').lower() == 'bytes')
+        etag = response.headers.get('ETag')
+        # 使用重定向后的地址，避免每个分段重复跳转
+        file_url = response.url
+
+        if not accept_ranges or total_size < PARALLEL_MIN_SIZE or num_conns <= 1:
+            if os.path.exists(state_path):
+                # 之前分段下载时文件已预分配为完整大小，不能按文件大小续传
+                response.close()
+                for path in (state_path, save_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                return self.download_file(url, save_path, progress_callback, status_callback)
+            return self.download_file(url, save_path, progress_callback, status_callback, response=response)
+        response.close()
+
+        os.makedirs(os.path.dirname(save_path) if os.path.dirname(save_path) else '.', exist_ok=True)
+        
+        # 本地其他位置已有相同文件时直接复制
+        if self._clone_from_index(etag, total_size, save_path, status_callback):
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            if progress_callback:
+                progress_callback(total_size, total_size, 0, 100.0)
+            if status_callback:
+                status_callback("下载完成！")
+            return True
+        
+        done_ranges = self._load_part_state(state_path, save_path, total_size, etag, status_callback)
+        if done_ranges is None:
+            if status_callback:
+                status_callback("文件已存在且完整，无需重新下载")
+            if progress_callback:
+                progress_callback(total_size, total_size, 0, 100.0)
+            return True
+
+        part_size = min(PART_SIZE_MAX, math.ceil(total_size / num_conns))
+        pending = []
+        for lo in range(0, total_size, part_size):
+            hi = min(lo + part_size, total_size) - 1
+            # 跳过已完成的部分（可能只覆盖分段的前半截）
+            covered = True
+            while lo <= hi:
+                prefix = next((r for r in done_ranges if r[0] <= lo <= r[1]), None)
+                if prefix is None:
+                    covered = False
+                    break
+                lo = prefix[1] + 1
+            if not covered:
+                pending.append((lo, hi))
+
+        downloaded_size = total_size - sum(hi - lo + 1 for lo, hi in pending)
+        if downloaded_size > 0 and status_callback:
+            status_callback(f"从 {self.format_size(downloaded_size)} 处继续下载...")
+        if status_callback:
+            status_callback(f"分段下载: {len(pending)} 段, {num_conns} 个连接")
+
+        state_lock = threading.Lock()
+
+        def range_finished(lo, hi):
+            with state_lock:
+                done_ranges.append([lo, hi])
+                self._save_part_state(state_path, file_url, total_size, etag, done_ranges)
+
+        # 先写进度文件再扩展文件大小：已预分配的文件只以进度文件作为下载进度的依据
+        self._save_part_state(state_path, file_url, total_size, etag, done_ranges)
+        fd = os.open(save_path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        try:
+            os.ftruncate(fd, total_size)
+            _preallocate(fd, 0, total_size)
+
+            fetch_ranges = self._fetch_ranges_curl if USE_PYCURL else self._fetch_ranges_threads
+            errors = fetch_ranges(file_url, fd, pending, num_conns, total_size, downloaded_size,
+                                  range_finished, progress_callback)
+
+            if errors:
+                if status_callback:
+                    status_callback(f"下载出错: {str(errors[0])}")
+                return False
+
+            if self.cancel_flag:
+                if status_callback:
+                    status_callback("下载已取消")
+                return False
+        finally:
+            os.close(fd)
+
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        self._remember_local(etag, save_path, total_size)
+
+        if progress_callback:
+            progress_callback(total_size, total_size, 0, 100.0)
+        if status_callback:
+            status_callback("下载完成！")
+        return True
+
+    def _fetch_ranges_threads(self, file_url, fd, pending, num_conns, total_size, downloaded_size,
+                              range_finished, progress_callback):
+        """
+        用线程池并发下载各个分段，写入 fd 的对应偏移
+        返回出错的异常列表
+        """
+        counter_lock = threading.Lock()
+        counter = [downloaded_size]
+        abort = threading.Event()
+
+        def fetch_range(lo, hi):
+            headers = dict(IDENTITY_ENCODING, Range=f'bytes={lo}-{hi}')
+            with self.session.get(file_url, headers=headers, stream=True, timeout=30) as resp:
+                if resp.status_code != 206:
+                    raise IOError(f"分段请求失败: HTTP {resp.status_code}")
+                offset = lo
+                for chunk in resp.iter_content(chunk_size=1 << 16):
+                    while self.pause_flag and not self.cancel_flag:
+                        time.sleep(0.1)
+                    if self.cancel_flag or abort.is_set():
+                        return False
                     if chunk:
-                        f.write(chunk)
+                        _pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                        with counter_lock:
+                            counter[0] += len(chunk)
+                if offset != hi + 1:
+                    raise IOError(f"分段数据不完整: {lo}-{hi}")
+            range_finished(lo, hi)
+            return True
+
+        last_update_time = time.time()
+        last_downloaded = downloaded_size
+        with ThreadPoolExecutor(max_workers=num_conns) as executor:
+            futures = [executor.submit(fetch_range, lo, hi) for lo, hi in pending]
+            not_done = futures
+            while not_done:
+                finished, not_done = wait(not_done, timeout=0.5, return_when=FIRST_EXCEPTION)
+                if any(f.exception() for f in finished):
+                    abort.set()
+
+                current_time = time.time()
+                elapsed = current_time - last_update_time
+                if progress_callback and elapsed > 0:
+                    speed = (counter[0] - last_downloaded) / elapsed
+                    percentage = counter[0] / total_size * 100
+                    progress_callback(counter[0], total_size, speed, percentage)
+                last_update_time = current_time
+                last_downloaded = counter[0]
+
+        return [f.exception() for f in futures if f.exception()]
+
+    def _fetch_ranges_curl(self, file_url, fd, pending, num_conns, total_size, downloaded_size,
+                           range_finished, progress_callback):
+        """
+        用一个 CurlMulti 并发下载各个分段（libcurl 后端）
+        返回出错的异常列表
+        """
+        transfers = [_CurlTransfer(file_url, fd, lo, hi) for lo, hi in pending]
+        errors = []
+
+        def on_done(transfer, ok):
+            if ok and transfer.offset == transfer.end + 1:
+                range_finished(transfer.start, transfer.end)
+            else:
+                errors.append(IOError(transfer.error or f"分段数据不完整: {transfer.start}-{transfer.end}"))
+            return ok
+
+        last = [time.time(), downloaded_size]
+
+        def on_tick():
+            downloaded = downloaded_size + sum(t.offset - t.start for t in transfers)
+            current_time = time.time()
+            speed = (downloaded - last[1]) / (current_time - last[0])
+            if progress_callback:
+                progress_callback(downloaded, total_size, speed, downloaded / total_size * 100)
+            last[:] = [current_time, downloaded]
+
+        self._curl_perform(transfers, num_conns, on_done, on_tick)
+        return errors
+
+    def _curl_perform(self, transfers, concurrency, on_done, on_tick=None):
+        """
+        在当前线程中用一个 CurlMulti 驱动所有传输，最多同时进行 concurrency 个
+        on_done(transfer, ok) 在每个传输结束时调用；返回 False 时不再开始新的传输
+        on_tick() 每0.5秒调用一次
+        """
+        multi = pycurl.CurlMulti()
+        multi.setopt(pycurl.M_MAX_TOTAL_CONNECTIONS, concurrency)
+        multi.setopt(pycurl.M_MAXCONNECTS, concurrency)
+        pending = deque(transfers)
+        active = {}
+        paused = False
+        last_tick = time.time()
+
+        def finish(handle, error=None):
+            transfer = active.pop(handle)
+            transfer.status = handle.getinfo(pycurl.RESPONSE_CODE)
+            multi.remove_handle(handle)
+            handle.close()
+            transfer.handle = None
+            if error and not transfer.error:
+                transfer.error = error
+            ok = transfer.succeeded()
+            if not ok and transfer.needs_restart():
+                transfer.restart()
+                pending.append(transfer)
+                return
+            if not on_done(transfer, ok):
+                pending.clear()
+
+        try:
+            while pending or active:
+                if self.cancel_flag:
+                    return
+                if self.pause_flag != paused:
+                    paused = self.pause_flag
+                    for handle in active:
+                        handle.pause(pycurl.PAUSE_ALL if paused else pycurl.PAUSE_CONT)
+                if paused:
+                    time.sleep(0.1)
+                    continue
+
+                while pending and len(active) < concurrency:
+                    transfer = pending.popleft()
+                    handle = transfer.create_handle(self)
+                    multi.add_handle(handle)
+                    active[handle] = transfer
+
+                while True:
+                    ret, _ = multi.perform()
+                    if ret != pycurl.E_CALL_MULTI_PERFORM:
+                        break
+
+                while True:
+                    queued, ok_list, err_list = multi.info_read()
+                    for handle in ok_list:
+                        finish(handle)
+                    for handle, _, errmsg in err_list:
+                        finish(handle, errmsg)
+                    if queued == 0:
+                        break
+
+                if on_tick and time.time() - last_tick >= 0.5:
+                    on_tick()
+                    last_tick = time.time()
+                multi.select(0.5)
+        finally:
+            for handle, transfer in active.items():
+                multi.remove_handle(handle)
+                handle.close()
+                transfer.handle = None
+            multi.close()
+
+    def download_batch_curl(self, jobs, callbacks_for, file_finished):
+        """
+        在后台线程中用一个 CurlMulti 并发下载多个文件（libcurl 后端）
+        参数与返回值同 download_batch_async
+        """
+        return _batch_executor.submit(self._curl_batch, jobs, callbacks_for, file_finished)
+
+    def _curl_batch(self, jobs, callbacks_for, file_finished):
+        """download_batch_curl 的实现，支持断点续传"""
+        transfers = []
+        results = {}
+        try:
+            for relative_path, url, save_path in jobs:
+                transfer = _CurlTransfer(url, key=relative_path, resume=True, path=save_path)
+                transfer.progress_callback, transfer.status_callback = callbacks_for(relative_path)
+                transfers.append(transfer)
+
+            def on_done(transfer, ok):
+                if transfer.already_complete:
+                    transfer.status_callback("文件已存在且完整，无需重新下载")
+                elif ok:
+                    os.ftruncate(transfer.fd, transfer.offset)
+                    transfer.status_callback("下载完成！")
+                else:
+                    transfer.status_callback(f"下载出错: {transfer.error or f'HTTP {transfer.status}'}")
+                if ok:
+                    transfer.progress_callback(transfer.offset, transfer.offset, 0, 100.0)
+                os.close(transfer.fd)
+                transfer.fd = None
+                results[transfer.key] = ok
+                file_finished(transfer.key, ok)
+                return True
+
+            last = {}
+
+            def on_tick():
+                current_time = time.time()
+                for transfer in transfers:
+                    if transfer.key in results or not transfer.started:
+                        continue
+                    prev_time, prev_offset = last.get(transfer.key, (current_time - 0.5, transfer.start))
+                    # 从头重新传输后 offset 会变小
+                    speed = max(transfer.offset - prev_offset, 0) / max(current_time - prev_time, 1e-6)
+                    total = transfer.total
+                    percentage = (transfer.offset / total * 100) if total > 0 else 0
+                    transfer.progress_callback(transfer.offset, total, speed, percentage)
+                    last[transfer.key] = (current_time, transfer.offset)
+
+            self._curl_perform(transfers, BATCH_WORKERS, on_done, on_tick)
+        finally:
+            for transfer in transfers:
+                if transfer.fd is not None:
+                    os.close(transfer.fd)
+
+        if self.cancel_flag:
+            for transfer in transfers:
+                if transfer.key not in results:
+                    transfer.status_callback("下载已取消")
+        return [results.get(relative_path, False) for relative_path, _, _ in jobs]
+
+    def _load_part_state(self, state_path, save_path, total_size, etag, status_callback=None):
+        """
+        读取分段下载进度
+        返回已完成的分段列表；文件已完整时返回 None
+        进度文件存在时只信任其中记录的分段（文件已预分配为完整大小）
+        """
+        if os.path.exists(state_path) and os.path.exists(save_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('total') == total_size and state.get('etag') == etag:
+                    return [list(r) for r in state.get('done', [])]
+                if status_callback:
+                    status_callback("远程文件已变化，从头开始下载...")
+            except (OSError, ValueError) as e:
+                print(f"读取分段进度失败: {e}")
+            return []
+
+        if os.path.exists(save_path):
+            existing = os.path.getsize(save_path)
+            if existing == total_size:
+                return None
+            # 之前单连接下载的部分视为已完成的前缀
+            if 0 < existing < total_size:
+                return [[0, existing - 1]]
+        return []
+
+    def _save_part_state(self, state_path, url, total_size, etag, done_ranges):
+        """保存分段下载进度（ETag 用于续传时确认远程文件未变化）"""
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'total': total_size, 'etag': etag, 'done': done_ranges}, f)
+        os.replace(tmp_path, state_path)
+
+    def _get_loop(self):
+        """获取后台事件循环，首次调用时在守护线程中启动"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    def download_batch_async(self, jobs, callbacks_for, file_finished):
+        """
+        在后台事件循环中用 aiohttp 并发下载多个文件
+
+        Args:
+            jobs: [(relative_path, download_url, save_path), ...]
+            callbacks_for: 生成回调的函数 relative_path -> (progress_callback, status_callback)
+            file_finished: 单个文件完成时调用 (relative_path, success)
+        返回: concurrent.futures.Future，结果为每个文件是否成功的列表
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._adownload_all(jobs, callbacks_for, file_finished), self._get_loop())
+
+    async def _adownload_all(self, jobs, callbacks_for, file_finished):
+        """共用一个 ClientSession 并发下载，信号量限制同时进行的文件数"""
+        semaphore = asyncio.Semaphore(BATCH_WORKERS)
+        connector = aiohttp.TCPConnector(limit=AIO_LIMIT, limit_per_host=AIO_LIMIT_PER_HOST,
+                                         keepalive_timeout=AIO_KEEPALIVE)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=dict(self.session.headers, **IDENTITY_ENCODING)) as session:
+            async def run(relative_path, url, save_path):
+                progress_callback, status_callback = callbacks_for(relative_path)
+                async with semaphore:
+                    ok = await self._adownload(session, url, save_path, progress_callback, status_callback)
+                file_finished(relative_path, ok)
+                return ok
+
+            return await asyncio.gather(*(run(*job) for job in jobs))
+
+    async def _adownload(self, session, url, save_path, progress_callback=None, status_callback=None):
+        """aiohttp 版本的 download_file，支持断点续传"""
+        loop = asyncio.get_running_loop()
+
+        downloaded_size = 0
+        if os.path.exists(save_path):
+            downloaded_size = os.path.getsize(save_path)
+
+        headers = {}
+        if downloaded_size > 0:
+            headers['Range'] = f'bytes={downloaded_size}-'
+
+        try:
+            response = await session.get(url, headers=headers)
+            # 请求范围超出文件末尾，说明已下载完整
+            if response.status == 416:
+                total_size = _parse_total_size(response.headers, response.status)
+                response.release()
+                if total_size == downloaded_size:
+                    if status_callback:
+                        status_callback("文件已存在且完整，无需重新下载")
+                    if progress_callback:
+                        progress_callback(total_size, total_size, 0, 100.0)
+                    return True
+                if status_callback:
+                    status_callback("本地文件与远程文件不一致，从头开始下载...")
+                downloaded_size = 0
+                response = await session.get(url)
+
+            async with response:
+                if downloaded_size > 0 and response.status != 206:
+                    if response.status == 200 and status_callback:
+                        status_callback("服务器不支持断点续传，从头开始下载...")
+                    downloaded_size = 0
+
+                if response.status not in [200, 206]:
+                    if status_callback:
+                        status_callback(f"下载失败: HTTP {response.status}")
+                    return False
+
+                total_size = _parse_total_size(response.headers, response.status)
+
+                mode = 'ab' if downloaded_size > 0 else 'wb'
+                last_update_time = time.time()
+                last_downloaded = downloaded_size
+
+                with open(save_path, mode) as f:
+                    async for chunk in response.content.iter_chunked(AIO_CHUNK_SIZE):
+                        while self.pause_flag and not self.cancel_flag:
+                            await asyncio.sleep(0.1)
+
+                        if self.cancel_flag:
+                            if status_callback:
+                                status_callback("下载已取消")
+                            return False
+
+                        # 写盘放到线程池，避免阻塞事件循环
+                        await loop.run_in_executor(None, f.write, chunk)
                         downloaded_size += len(chunk)
-                        
-                        # 计算速度和进度
+
                         current_time = time.time()
-                        if current_time - last_update_time >= 0.5:  # 每0.5秒更新一次
+                        if current_time - last_update_time >= 0.5:
                             elapsed = current_time - last_update_time
                             speed = (downloaded_size - last_downloaded) / elapsed
                             percentage = (downloaded_size / total_size * 100) if total_size > 0 else 0
-                            
                             if progress_callback:
                                 progress_callback(downloaded_size, total_size, speed, percentage)
-                            
                             last_update_time = current_time
                             last_downloaded = downloaded_size
-            
-            # 最终更新进度
+
             if progress_callback:
                 progress_callback(downloaded_size, total_size, 0, 100.0)
-            
             if status_callback:
                 status_callback("下载完成！")
-            
             return True
-            
+
         except Exception as e:
             if status_callback:
                 status_callback(f"下载出错: {str(e)}")
             return False
-    
+
+    def reset_flags(self):
+        """开始新的下载任务前重置暂停/取消标志（批量下载时多个文件共用）"""
+        self.cancel_flag = False
+        self.pause_flag = False
+
     def cancel_download(self):
         """取消下载"""
         self.cancel_flag = True
@@ -234,7 +1322,7 @@ class HFDownloader:
     
     def get_repo_files(self, username, model, branch='main', subpath=''):
         """
-        获取HuggingFace仓库中的所有文件列表
+        获取HuggingFace仓库中的所有文件列表（包括所有子目录，一次请求返回整棵树）
         返回: [(relative_path, download_url, file_size), ...]
         """
         try:
@@ -242,21 +1330,44 @@ class HFDownloader:
             api_url = f"https://hf-mirror.com/api/models/{username}/{model}/tree/{branch}"
             if subpath:
                 api_url += f"/{subpath}"
+            api_url += "?recursive=1"
+            
+            with self._meta_lock:
+                cached = self._meta_cache['tree'].get(api_url)
             
-            response = self.session.get(api_url, timeout=30)
+            client = self.api_client or self.session
+            response = client.get(api_url, headers=self._conditional_headers(cached), timeout=30)
+            # 仓库未变化，直接使用缓存的文件列表
+            if response.status_code == 304 and cached:
+                return [tuple(f) for f in cached['files']]
             if response.status_code != 200:
                 return None
             
             files_info = []
-            data = response.json()
-            
-            for item in data:
-                if item['type'] == 'file':
-                    relative_path = item['path']
-                    file_size = item.get('size', 0)
-                    download_url = f"https://hf-mirror.com/{username}/{model}/resolve/{branch}/{relative_path}"
-                    files_info.append((relative_path, download_url, file_size))
+            page = response
+            while True:
+                for item in page.json():
+                    if item['type'] == 'file':
+                        relative_path = item['path']
+                        file_size = item.get('size', 0)
+                        download_url = f"https://hf-mirror.com/{username}/{model}/resolve/{branch}/{relative_path}"
+                        files_info.append((relative_path, download_url, file_size))
+                
+                # 文件很多时 API 会分页，下一页地址在 Link 头中（基于游标，只能依次获取）
+                next_link = page.links.get('next', {}).get('url')
+                if not next_link:
+                    break
+                page = client.get(urljoin(api_url, next_link), timeout=30)
+                if page.status_code != 200:
+                    return None
             
+            # 只缓存单页的列表：分页时第一页的 ETag 反映不了后续页的变化
+            if page is response:
+                self._update_meta_cache('tree', api_url, response, files=files_info)
+            elif cached:
+                with self._meta_lock:
+                    self._meta_cache['tree'].pop(api_url, None)
+                    self._save_meta_cache()
             return files_info
             
         except Exception as e:
@@ -264,6 +1375,266 @@ class HFDownloader:
             return None
 
 
+def _engine_main(commands, events, progress):
+    """
+    下载进程入口：执行界面进程提交的任务
+    状态消息与完成事件放入 events 队列，进度直接写入共享内存中对应的槽
+    """
+    downloader = HFDownloader()
+
+    def run(job_id, slot, url, save_path):
+        base = slot * 4
+
+        def progress_callback(downloaded, total, speed, percentage):
+            progress[base:base + 4] = [downloaded, total, speed, percentage]
+
+        def status_callback(message):
+            events.put(('status', job_id, message))
+
+        try:
+            ok = downloader.download_file_parallel(
+                url,
+                save_path,
+                progress_callback=progress_callback,
+                status_callback=status_callback
+            )
+        except Exception as e:
+            status_callback(f"下载出错: {str(e)}")
+            ok = False
+        events.put(('done', job_id, ok))
+
+    while True:
+        command = commands.get()
+        kind = command[0]
+        if kind == 'download':
+            threading.Thread(target=run, args=command[1:], daemon=True).start()
+        elif kind == 'pause':
+            downloader.pause_download()
+        elif kind == 'resume':
+            downloader.resume_download()
+        elif kind == 'cancel':
+            downloader.cancel_download()
+        elif kind == 'reset':
+            downloader.reset_flags()
+        elif kind == 'stop':
+            break
+
+
+class DownloaderProcess:
+    """
+    在独立进程中运行 HFDownloader
+    下载时的 TLS 解密、数据拷贝不再与 Tk 主循环争抢 GIL；
+    回调在本进程的监听线程中调用，用法与 download_file_parallel 相同
+    """
+
+    def __init__(self):
+        ctx = multiprocessing.get_context('spawn')
+        self._commands = ctx.Queue()
+        self._events = ctx.Queue()
+        # 每个槽依次为 已下载、总大小、速度、百分比，展示用，无需加锁
+        self._progress = ctx.Array('d', ENGINE_SLOTS * 4, lock=False)
+        self._process = ctx.Process(
+            target=_engine_main,
+            args=(self._commands, self._events, self._progress),
+            daemon=True
+        )
+        self._process.start()
+
+        self._jobs = {}  # 任务 id -> (槽, 进度回调, 状态回调, 完成回调)
+        self._jobs_lock = threading.Lock()
+        self._closed = False  # 监听线程已退出，不再接受任务
+        self._next_id = 0
+        self._free_slots = queue.Queue()
+        for slot in range(ENGINE_SLOTS):
+            self._free_slots.put(slot)
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def is_alive(self):
+        """下载进程与监听线程是否都在运行"""
+        return self._process.is_alive() and self._listener.is_alive()
+
+    def submit(self, url, save_path, progress_callback=None, status_callback=None, done_callback=None):
+        """
+        提交下载任务，立即返回任务 id，完成后以是否成功调用 done_callback
+        下载进程已退出时抛出 RuntimeError
+        """
+        if not self.is_alive():
+            raise RuntimeError("下载进程已退出")
+        slot = self._free_slots.get()
+        base = slot * 4
+        self._progress[base:base + 4] = [0, 0, 0, 0]
+        with self._jobs_lock:
+            if self._closed:
+                self._free_slots.put(slot)
+                raise RuntimeError("下载进程已退出")
+            job_id = self._next_id
+            self._next_id += 1
+            self._jobs[job_id] = (slot, progress_callback, status_callback, done_callback)
+        self._commands.put(('download', job_id, slot, url, save_path))
+        return job_id
+
+    def download(self, url, save_path, progress_callback=None, status_callback=None):
+        """提交下载任务并等待完成，返回是否成功"""
+        finished = threading.Event()
+        result = [False]
+
+        def done_callback(success):
+            result[0] = success
+            finished.set()
+
+        try:
+            self.submit(url, save_path, progress_callback, status_callback, done_callback)
+        except RuntimeError as e:
+            if status_callback:
+                status_callback(f"下载出错: {str(e)}")
+            return False
+        finished.wait()
+        return result[0]
+
+    def pause(self):
+        self._commands.put(('pause',))
+
+    def resume(self):
+        self._commands.put(('resume',))
+
+    def cancel(self):
+        self._commands.put(('cancel',))
+
+    def reset(self):
+        self._commands.put(('reset',))
+
+    def _report_progress(self, slot, progress_callback):
+        """读取共享内存中的进度并回调"""
+        if progress_callback:
+            base = slot * 4
+            downloaded, total, speed, percentage = self._progress[base:base + 4]
+            progress_callback(int(downloaded), int(total), speed, percentage)
+
+    def _finish(self, job, success):
+        slot, progress_callback, _, done_callback = job
+        self._report_progress(slot, progress_callback)
+        self._free_slots.put(slot)
+        if done_callback:
+            done_callback(success)
+
+    def _listen(self):
+        """监听线程：分发状态与完成事件，每 0.5 秒读取一次进度"""
+        last_report = 0
+        while True:
+            try:
+                kind, job_id, value = self._events.get(timeout=0.5)
+            except queue.Empty:
+                kind = None
+
+            if kind == 'status':
+                with self._jobs_lock:
+                    job = self._jobs.get(job_id)
+                if job and job[2]:
+                    job[2](value)
+            elif kind == 'done':
+                with self._jobs_lock:
+                    job = self._jobs.pop(job_id, None)
+                if job:
+                    self._finish(job, value)
+
+            if not self._process.is_alive():
+                # 下载进程意外退出，未完成的任务都视为失败
+                with self._jobs_lock:
+                    self._closed = True
+                    jobs = list(self._jobs.values())
+                    self._jobs.clear()
+                for job in jobs:
+                    if job[2]:
+                        job[2]("下载进程已退出")
+                    self._finish(job, False)
+                return
+
+            now = time.time()
+            if now - last_report >= 0.5:
+                last_report = now
+                with self._jobs_lock:
+                    active = list(self._jobs.values())
+                for slot, progress_callback, _, _ in active:
+                    self._report_progress(slot, progress_callback)
+
+
+class _FileRow:
+    """文件选择窗口中的一行"""
+
+    __slots__ = ('path', 'url', 'size', 'size_text', 'checked')
+
+    def __init__(self, path, url, size, size_text, checked=True):
+        self.path = path
+        self.url = url
+        self.size = size
+        self.size_text = size_text  # 格式化后的大小，只计算一次
+        self.checked = checked
+
+
+class _FileSelection:
+    """
+    文件选择窗口的数据
+    行按整数下标保存（Treeview 的 item id 即为下标字符串），
+    可见行集合由过滤维护，已选数量/大小随勾选增量更新，无需每次遍历整个列表
+    """
+
+    def __init__(self, tree, files, format_size):
+        self.tree = tree
+        self.rows = []
+        for i, (path, url, size) in enumerate(files):
+            row = _FileRow(path, url, size, format_size(size))
+            tree.insert('', 'end', iid=str(i),
+                        text='☑',
+                        values=(row.size_text, path),
+                        tags=('checked',))
+            self.rows.append(row)
+        self.visible = set(range(len(self.rows)))
+        self.selected_count = len(self.rows)  # 可见行中已选的数量
+        self.selected_size = sum(row.size for row in self.rows)  # 可见行中已选的大小
+
+    def set_checked(self, index, checked):
+        """设置某一行的选中状态"""
+        row = self.rows[index]
+        if row.checked == checked:
+            return
+        row.checked = checked
+        self.tree.item(str(index), text='☑' if checked else '☐')
+        if index in self.visible:
+            self.selected_count += 1 if checked else -1
+            self.selected_size += row.size if checked else -row.size
+
+    def toggle(self, item_id):
+        """切换 Treeview 中某一项的选中状态"""
+        index = int(item_id)
+        self.set_checked(index, not self.rows[index].checked)
+
+    def set_visible(self, checked):
+        """将所有可见行设为选中/未选中"""
+        for index in self.visible:
+            self.set_checked(index, checked)
+
+    def invert_visible(self):
+        """反选所有可见行"""
+        for index in self.visible:
+            self.set_checked(index, not self.rows[index].checked)
+
+    def filter(self, query):
+        """只显示路径包含 query 的行"""
+        query = query.lower()
+        visible = [i for i, row in enumerate(self.rows) if query in row.path.lower()]
+        # 一次调用替换全部子项，不匹配的项自动 detach
+        self.tree.set_children('', *(str(i) for i in visible))
+        self.visible = set(visible)
+        self.selected_count = sum(1 for i in visible if self.rows[i].checked)
+        self.selected_size = sum(self.rows[i].size for i in visible if self.rows[i].checked)
+
+    def selected_files(self):
+        """返回可见且选中的文件 [(path, url, size), ...]"""
+        return [(row.path, row.url, row.size) for i, row in enumerate(self.rows)
+                if row.checked and i in self.visible]
+
+
 class DownloaderGUI:
     """下载器图形界面"""
     
@@ -274,16 +1645,23 @@ class DownloaderGUI:
         self.root.resizable(True, True)
         
         self.downloader = HFDownloader()
+        self.engine = None  # 下载进程，首次下载时启动
         self.download_thread = None
         self.is_downloading = False
         self.batch_mode = False  # 批量下载模式
         self.file_queue = []  # 文件下载队列
-        self.current_file_index = 0  # 当前下载文件索引
+        self._batch_lock = threading.Lock()
+        self._batch_progress = {}  # 每个文件的 (已下载, 速度)
+        self._batch_total = 0  # 批量下载总大小
         self.all_files = []  # 所有文件列表
         self.file_selection_window = None  # 文件选择窗口
         
         self.create_widgets()
         
+        # 进度和日志先放入队列，由主线程定时统一刷新界面
+        self._ui_queue = queue.Queue()
+        self.root.after(UI_REFRESH_INTERVAL, self._drain_ui)
+        
     def create_widgets(self):
         """创建界面组件"""
         # 主框架
@@ -392,14 +1770,38 @@ class DownloaderGUI:
             self.batch_progress_frame.grid_remove()
     
     def log_message(self, message):
-        """添加日志消息"""
+        """添加日志消息（可在任意线程调用）"""
         timestamp = time.strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        self._ui_queue.put_nowait(('log', f"[{timestamp}] {message}\n"))
     
     def update_progress(self, downloaded, total, speed, percentage):
-        """更新进度"""
+        """更新进度（可在任意线程调用）"""
+        self._ui_queue.put_nowait(('progress', (downloaded, total, speed, percentage)))
+    
+    def _drain_ui(self):
+        """取出队列中的所有事件：日志合并为一次插入，进度只显示最新一次"""
+        lines = []
+        progress = None
+        try:
+            while True:
+                kind, value = self._ui_queue.get_nowait()
+                if kind == 'log':
+                    lines.append(value)
+                else:
+                    progress = value
+        except queue.Empty:
+            pass
+        
+        if lines:
+            self.log_text.insert(tk.END, ''.join(lines))
+            self.log_text.see(tk.END)
+        if progress:
+            self._show_progress(*progress)
+        
+        self.root.after(UI_REFRESH_INTERVAL, self._drain_ui)
+    
+    def _show_progress(self, downloaded, total, speed, percentage):
+        """显示进度"""
         self.progress_bar['value'] = percentage
         
         if total > 0:
@@ -413,7 +1815,6 @@ class DownloaderGUI:
                 progress_text += f" | 速度: {self.downloader.format_speed(speed)}"
         
         self.progress_label['text'] = progress_text
-        self.root.update_idletasks()
     
     def update_status(self, message):
         """更新状态"""
@@ -466,18 +1867,20 @@ class DownloaderGUI:
         self.log_message(f"保存位置: {save_path}")
         
         # 更新按钮状态
-        self.download_btn['state'] = tk.DISABLED
-        self.pause_btn['state'] = tk.NORMAL
-        self.cancel_btn['state'] = tk.NORMAL
-        self.is_downloading = True
+        self._enable_download_controls()
         
-        # 在新线程中下载
-        self.download_thread = threading.Thread(
-            target=self._download_worker,
-            args=(download_url, save_path),
-            daemon=True
-        )
-        self.download_thread.start()
+        # 提交到下载进程
+        try:
+            self._get_engine().submit(
+                download_url,
+                save_path,
+                progress_callback=self.update_progress,
+                status_callback=self.update_status,
+                done_callback=self._single_download_done
+            )
+        except RuntimeError as e:
+            self.log_message(f"下载出错: {str(e)}")
+            self._single_download_done(False)
     
     def start_batch_download(self, repo_info, save_dir):
         """开始批量下载"""
@@ -510,7 +1913,7 @@ class DownloaderGUI:
         
         self.all_files = files
         total_size = sum(f[2] for f in files)
-        self.root.after(0, lambda: self.log_message(f"找到 {len(files)} 个文件，总大小: {self.downloader.format_size(total_size)}"))
+        self.log_message(f"找到 {len(files)} 个文件，总大小: {self.downloader.format_size(total_size)}")
         
         # 显示文件选择窗口
         self.root.after(0, lambda: self._show_file_selection_window(files, save_dir))
@@ -548,11 +1951,11 @@ class DownloaderGUI:
         
         # 快速选择按钮
         ttk.Button(search_frame, text="全选", 
-                  command=lambda: self._select_all_files(tree, file_items, update_selection_count)).pack(side=tk.LEFT, padx=2)
+                  command=lambda: self._select_all_files(selection, update_selection_count)).pack(side=tk.LEFT, padx=2)
         ttk.Button(search_frame, text="反选", 
-                  command=lambda: self._invert_selection(tree, file_items, update_selection_count)).pack(side=tk.LEFT, padx=2)
+                  command=lambda: self._invert_selection(selection, update_selection_count)).pack(side=tk.LEFT, padx=2)
         ttk.Button(search_frame, text="清空", 
-                  command=lambda: self._clear_selection(tree, file_items, update_selection_count)).pack(side=tk.LEFT, padx=2)
+                  command=lambda: self._clear_selection(selection, update_selection_count)).pack(side=tk.LEFT, padx=2)
         
         # 文件列表（使用Treeview带复选框）
         list_frame = ttk.Frame(main_frame)
@@ -577,36 +1980,20 @@ class DownloaderGUI:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # 填充文件列表
-        file_items = {}  # 存储item_id和文件信息的映射
-        for i, (path, url, size) in enumerate(files):
-            item_id = tree.insert('', 'end', 
-                                 text='☑',
-                                 values=(self.downloader.format_size(size), path),
-                                 tags=('checked',))
-            file_items[item_id] = (path, url, size, True)  # True表示选中
+        selection = _FileSelection(tree, files, self.downloader.format_size)
         
         # 点击切换选中状态
         def toggle_item(event):
             item = tree.identify_row(event.y)
             if item:
-                current_state = file_items[item][3]
-                new_state = not current_state
-                tree.item(item, text='☑' if new_state else '☐')
-                path, url, size, _ = file_items[item]
-                file_items[item] = (path, url, size, new_state)
+                selection.toggle(item)
                 update_selection_count()
         
         tree.bind('<Button-1>', toggle_item)
         
         # 搜索过滤功能
         def filter_files(*args):
-            query = search_var.get().lower()
-            for item in tree.get_children():
-                path = file_items[item][0]
-                if query in path.lower():
-                    tree.reattach(item, '', 'end')
-                else:
-                    tree.detach(item)
+            selection.filter(search_var.get())
             update_selection_count()
         
         search_var.trace('w', filter_files)
@@ -619,11 +2006,9 @@ class DownloaderGUI:
         selection_label.pack(side=tk.LEFT)
         
         def update_selection_count():
-            visible_items = tree.get_children()
-            selected = sum(1 for item in visible_items if file_items[item][3])
-            selected_size = sum(file_items[item][2] for item in visible_items if file_items[item][3])
             selection_label.config(
-                text=f"已选择: {selected} 个文件 ({self.downloader.format_size(selected_size)})")
+                text=f"已选择: {selection.selected_count} 个文件 "
+                     f"({self.downloader.format_size(selection.selected_size)})")
         
         update_selection_count()
         
@@ -631,15 +2016,13 @@ class DownloaderGUI:
         button_frame.pack(side=tk.RIGHT)
         
         def start_selected_download():
-            selected_files = [(path, url, size) for item, (path, url, size, checked) in file_items.items() 
-                            if checked and item in tree.get_children()]
+            selected_files = selection.selected_files()
             
             if not selected_files:
                 messagebox.showwarning("警告", "请至少选择一个文件")
                 return
             
             self.file_queue = selected_files
-            self.current_file_index = 0
             
             self.file_selection_window.destroy()
             self.log_message(f"\n已选择 {len(selected_files)} 个文件开始下载")
@@ -651,37 +2034,31 @@ class DownloaderGUI:
                 self.log_message(f"  ... 还有 {len(selected_files)-5} 个文件")
             
             self._enable_download_controls()
-            self._download_next_file(save_dir)
+            self.download_thread = threading.Thread(
+                target=self._batch_download_worker,
+                args=(save_dir,),
+                daemon=True
+            )
+            self.download_thread.start()
         
         ttk.Button(button_frame, text="开始下载", 
                   command=start_selected_download).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="取消", 
                   command=self.file_selection_window.destroy).pack(side=tk.LEFT)
     
-    def _select_all_files(self, tree, file_items, update_callback):
+    def _select_all_files(self, selection, update_callback):
         """全选文件"""
-        for item in tree.get_children():
-            tree.item(item, text='☑')
-            path, url, size, _ = file_items[item]
-            file_items[item] = (path, url, size, True)
+        selection.set_visible(True)
         update_callback()
     
-    def _invert_selection(self, tree, file_items, update_callback):
+    def _invert_selection(self, selection, update_callback):
         """反选文件"""
-        for item in tree.get_children():
-            current_state = file_items[item][3]
-            new_state = not current_state
-            tree.item(item, text='☑' if new_state else '☐')
-            path, url, size, _ = file_items[item]
-            file_items[item] = (path, url, size, new_state)
+        selection.invert_visible()
         update_callback()
     
-    def _clear_selection(self, tree, file_items, update_callback):
+    def _clear_selection(self, selection, update_callback):
         """清空选择"""
-        for item in tree.get_children():
-            tree.item(item, text='☐')
-            path, url, size, _ = file_items[item]
-            file_items[item] = (path, url, size, False)
+        selection.set_visible(False)
         update_callback()
     
     def _enable_download_controls(self):
@@ -689,60 +2066,132 @@ class DownloaderGUI:
         self.download_btn['state'] = tk.DISABLED
         self.pause_btn['state'] = tk.NORMAL
         self.cancel_btn['state'] = tk.NORMAL
+        self.pause_btn['text'] = "暂停"
         self.is_downloading = True
+        self.downloader.reset_flags()
+        if self.engine is not None:
+            self.engine.reset()
+
+    def _get_engine(self):
+        """获取下载进程，未启动或已意外退出时启动新的下载进程"""
+        if self.engine is None or not self.engine.is_alive():
+            self.engine = DownloaderProcess()
+        return self.engine
     
-    def _download_next_file(self, save_dir):
-        """下载队列中的下一个文件"""
-        if self.current_file_index >= len(self.file_queue):
-            # 所有文件下载完成
-            self.log_message("✅ 所有文件下载完成！")
-            self._download_finished(True)
-            return
-        
-        relative_path, download_url, file_size = self.file_queue[self.current_file_index]
-        
-        # 更新批量进度
-        self.batch_label.config(text=f"整体进度: {self.current_file_index + 1}/{len(self.file_queue)} 文件")
-        self.log_message(f"\n⬇️ [{self.current_file_index + 1}/{len(self.file_queue)}] 下载: {relative_path}")
-        
-        # 确保子目录存在
-        save_path = os.path.join(save_dir, relative_path)
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        
-        # 在新线程中下载
-        self.download_thread = threading.Thread(
-            target=self._batch_download_worker,
-            args=(download_url, save_path, save_dir),
-            daemon=True
-        )
-        self.download_thread.start()
-    
-    def _batch_download_worker(self, url, save_path, save_dir):
-        """批量下载工作线程"""
-        success = self.downloader.download_file(
-            url,
-            save_path,
-            progress_callback=self.update_progress,
-            status_callback=self.update_status
-        )
-        
-        if success or not self.is_downloading:  # 成功或已取消
-            self.current_file_index += 1
-            if self.is_downloading:  # 如果没有取消，继续下一个
-                self.root.after(0, lambda: self._download_next_file(save_dir))
+    def _batch_callbacks(self, relative_path):
+        """为批量下载中的单个文件生成进度/状态回调，进度汇总为整体进度"""
+        def progress_callback(downloaded, total, speed, percentage):
+            with self._batch_lock:
+                self._batch_progress[relative_path] = (downloaded, speed)
+                batch_downloaded = sum(d for d, _ in self._batch_progress.values())
+                batch_speed = sum(s for _, s in self._batch_progress.values())
+            batch_total = self._batch_total
+            batch_percentage = (batch_downloaded / batch_total * 100) if batch_total > 0 else 0
+            self.update_progress(batch_downloaded, batch_total, batch_speed, batch_percentage)
+
+        def status_callback(message):
+            self.update_status(f"{relative_path}: {message}")
+
+        return progress_callback, status_callback
+
+    def _batch_download_worker(self, save_dir):
+        """
+        批量下载工作线程
+        小文件提交到线程池并发下载，大文件逐个走分段下载
+        """
+        total_count = len(self.file_queue)
+        self._batch_progress = {}
+        self._batch_total = sum(size for _, _, size in self.file_queue)
+        completed = [0]
+        success = True
+
+        def file_finished(relative_path, ok):
+            with self._batch_lock:
+                completed[0] += 1
+                n = completed[0]
+            mark = "✅" if ok else "❌"
+            self.root.after(0, lambda: self.batch_label.config(text=f"整体进度: {n}/{total_count} 文件"))
+            self.log_message(f"{mark} [{n}/{total_count}] {relative_path}")
+
+        small_files = [f for f in self.file_queue if f[2] < PARALLEL_MIN_SIZE]
+        large_files = [f for f in self.file_queue if f[2] >= PARALLEL_MIN_SIZE]
+
+        futures = {}
+        engine_future = None
+        jobs = []
+        for relative_path, download_url, file_size in small_files:
+            save_path = os.path.join(save_dir, relative_path)
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            jobs.append((relative_path, download_url, save_path))
+
+        if USE_PYCURL and jobs:
+            # 小文件由同一个 CurlMulti 并发下载
+            engine_future = self.downloader.download_batch_curl(jobs, self._batch_callbacks, file_finished)
+        elif aiohttp is not None and jobs:
+            # 小文件在同一个事件循环里并发下载
+            engine_future = self.downloader.download_batch_async(jobs, self._batch_callbacks, file_finished)
         else:
-            # 下载失败
-            self.root.after(0, lambda: self._download_finished(False))
+            for relative_path, download_url, save_path in jobs:
+                progress_callback, status_callback = self._batch_callbacks(relative_path)
+                future = _batch_executor.submit(
+                    self.downloader.download_file,
+                    download_url,
+                    save_path,
+                    progress_callback=progress_callback,
+                    status_callback=status_callback
+                )
+                futures[future] = relative_path
+
+        # 小文件在线程池中下载的同时，逐个分段下载大文件
+        for relative_path, download_url, file_size in large_files:
+            if not self.is_downloading or not success:
+                break
+            save_path = os.path.join(save_dir, relative_path)
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            progress_callback, status_callback = self._batch_callbacks(relative_path)
+            ok = self._get_engine().download(
+                download_url,
+                save_path,
+                progress_callback=progress_callback,
+                status_callback=status_callback
+            )
+            file_finished(relative_path, ok)
+            success = success and ok
+
+        if not success:
+            # 下载失败，未开始的文件不再下载
+            for future in futures:
+                future.cancel()
+            if engine_future is not None:
+                engine_future.cancel()
+
+        if engine_future is not None:
+            try:
+                success = all(engine_future.result()) and success
+            except Exception as e:
+                if not engine_future.cancelled():
+                    self.log_message(f"下载出错: {e}")
+                success = False
+
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            try:
+                ok = future.result()
+            except Exception as e:
+                self.log_message(f"{futures[future]}: 下载出错: {e}")
+                ok = False
+            file_finished(futures[future], ok)
+            success = success and ok
+
+        success = success and self.is_downloading
+        if success:
+            self.log_message("✅ 所有文件下载完成！")
+        self.is_downloading = False
+        self.root.after(0, self._download_finished, success)
     
-    def _download_worker(self, url, save_path):
-        """下载工作线程"""
-        success = self.downloader.download_file(
-            url,
-            save_path,
-            progress_callback=self.update_progress,
-            status_callback=self.update_status
-        )
-        
+    def _single_download_done(self, success):
+        """单文件下载完成（在下载进程的监听线程中调用）"""
         self.is_downloading = False
         
         # 更新按钮状态
@@ -763,10 +2212,14 @@ class DownloaderGUI:
         """暂停/恢复下载"""
         if self.downloader.pause_flag:
             self.downloader.resume_download()
+            if self.engine is not None:
+                self.engine.resume()
             self.pause_btn['text'] = "暂停"
             self.log_message("恢复下载...")
         else:
             self.downloader.pause_download()
+            if self.engine is not None:
+                self.engine.pause()
             self.pause_btn['text'] = "恢复"
             self.log_message("已暂停下载")
     
@@ -774,12 +2227,15 @@ class DownloaderGUI:
         """取消下载"""
         if messagebox.askyesno("确认", "确定要取消下载吗？"):
             self.downloader.cancel_download()
+            if self.engine is not None:
+                self.engine.cancel()
             self.is_downloading = False  # 停止批量下载队列
             self.log_message("正在取消下载...")
 
 
 def main():
     """主函数"""
+    multiprocessing.freeze_support()  # 打包为 exe 时下载进程需要
     root = tk.Tk()
     app = DownloaderGUI(root)
     root.mainloop()